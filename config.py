@@ -11,11 +11,21 @@ EMG_STREAM_PORT = 50041
 NUM_SENSORS = 4
 ACTIVE_CHANNELS = 4
 SAMPLING_RATE = 2000.0
+# Frames the handler accumulates before publishing one batch to the worker
+# (32 frames = 16 ms at 2 kHz)
+EMG_BATCH_FRAMES = 32
+
+# Maximum recording segment length used to preallocate the recording buffer
+MAX_RECORD_SECONDS = 600
 
 # File and directory configuration
 DEFAULT_SAVE_DIRECTORY = "./recordings"
 MUSCLE_LABELS_FILE = "muscle_labels.yaml"
 
+# Live plot configuration: the worker mean-pools samples by this factor into
+# a display ring (2 kHz -> 250 Hz at 8); the charts cannot resolve more
+LIVE_DOWNSAMPLE = 8
+
 # Signal processing configuration
 NOTCH_FREQ = 60.0
 NOTCH_Q = 30.0
@@ -6,26 +6,43 @@ import os
 import datetime
 from utils import load_muscle_labels
 
+# Reusable row-block scratch for the streaming writer: the file is
+# written in (block, 17) float32 chunks, so peak memory is O(block)
+# regardless of trial length. Padding columns are never written, so
+# they remain zero across reuses.
+_BLOCK_ROWS = 65536
+_block_cache = {'buffer': None}
 
-def save_emg_recording(save_directory, recording_data_buffer, start_time, sampling_rate, 
+
+def _get_block_buffer(num_cols):
+    """Return the zero-padded (_BLOCK_ROWS, num_cols) float32 scratch block."""
+    buffer = _block_cache['buffer']
+    if buffer is None or buffer.shape[1] != num_cols:
+        buffer = np.zeros((_BLOCK_ROWS, num_cols), dtype=np.float32)
+        _block_cache['buffer'] = buffer
+    return buffer
+
+
+def save_emg_recording(save_directory, recording_array, recording_lengths, start_time, sampling_rate,
                       muscle_labels, recording_session_start_time, trial_counter):
     """
     Save EMG recording data in MATLAB-compatible format with (samples, channels+1) matrix structure.
     First column contains timestamps, subsequent columns contain channel data with support for
     both actual EMG channels and padding to meet MATLAB requirements.
-    
+
     Args:
         save_directory: Base directory for saving files
-        recording_data_buffer: List where [0] is timestamps, [1:] are channel data
+        recording_array: (num_sensors, max_samples) array holding the recorded channel data
+        recording_lengths: Per-channel count of samples written into recording_array
         start_time: Recording start timestamp (not used in current implementation but kept for compatibility)
         sampling_rate: Sampling rate in Hz
         muscle_labels: List of muscle label strings
         recording_session_start_time: Session start datetime
         trial_counter: Current trial number
-    
+
     Returns:
         tuple: (success, message, min_samples) where min_samples indicates the number of samples
-              saved after trimming/padding operations
+              saved after trimming operations
     """
     try:
         # Create subdirectories
@@ -33,60 +50,51 @@ def save_emg_recording(save_directory, recording_data_buffer, start_time, sampli
         structs_directory = os.path.join(save_directory, "structs")
         os.makedirs(metadata_directory, exist_ok=True)
         os.makedirs(structs_directory, exist_ok=True)
-        
+
         # Analyze data and find minimum sample count
-        num_sensors = len(recording_data_buffer) - 1  # Exclude unused timestamp buffer slot
-        sample_counts = [len(recording_data_buffer[i]) for i in range(1, num_sensors + 1)]
-        
+        num_sensors = recording_array.shape[0]
+        sample_counts = [int(count) for count in recording_lengths]
+
         if not sample_counts or all(count == 0 for count in sample_counts):
             return False, "No data was captured.", 0
-            
+
         min_samples = min(sample_counts)
         print(f"Minimum samples across channels: {min_samples}")
-        
+
         if min_samples == 0:
             return False, "No data was captured (after trimming).", 0
-        
+
         # Generate timestamps
         timestamps = generate_timestamps(min_samples, start_time, sampling_rate)
-        
-        # Create data matrix in MATLAB-compatible format: (samples, channels+1)
-        # First column: timestamps, subsequent columns: channel data
-        # Pad with zeros to match expected 17 channels (1 timestamp + 16 DAQ channels) 
-        # even though we only have data for 4 EMG channels
-        expected_channels = 16  # Expected by MATLAB script
-        data_matrix = np.zeros((min_samples, expected_channels + 1), dtype=np.float64)
-        data_matrix[:, 0] = timestamps
-        
-        # Fill in channel data, ensuring all channels have the same length
-        for i in range(1, num_sensors + 1):
-            buffer_data = recording_data_buffer[i]
-            
-            if len(buffer_data) > min_samples:
-                # Trim excess data
-                channel_data = np.array(buffer_data[:min_samples], dtype=np.float64)
-            elif len(buffer_data) < min_samples:
-                # Pad with zeros if needed
-                padded_data = buffer_data + [0.0] * (min_samples - len(buffer_data))
-                channel_data = np.array(padded_data, dtype=np.float64)
-                print(f"Warning: Padding channel {i-1} data.")
-            else:
-                channel_data = np.array(buffer_data, dtype=np.float64)
-            
-            data_matrix[:, i] = channel_data
-        
+
         # Generate filenames with structured naming
         timestamp_str = recording_session_start_time.strftime("%Y%m%d_%H%M%S")
         trial_str = f"{trial_counter:04d}"
         filename_base = f"{timestamp_str}_Trl{trial_str}"
-        
+
         bin_filename = os.path.join(save_directory, f"{filename_base}.bin")
         meta_filename = os.path.join(metadata_directory, f"{timestamp_str}_METADATATrl{trial_str}.mat")
-        
-        # Save binary data in the correct format
-        data_matrix.tofile(bin_filename)
+
+        # Stream the matrix to disk in MATLAB-compatible format:
+        # (samples, channels+1) rows where the first column is timestamps
+        # and the channel columns are padded with zeros to the expected 16
+        # DAQ channels. Writing row blocks keeps peak memory O(block) even
+        # for hour-long trials; the bytes are identical to a single tofile.
+        expected_channels = 16  # Expected by MATLAB script
+        block_buffer = _get_block_buffer(expected_channels + 1)
+        with open(bin_filename, 'wb', buffering=1 << 20) as bin_file:
+            written = 0
+            while written < min_samples:
+                rows = min(_BLOCK_ROWS, min_samples - written)
+                block = block_buffer[:rows]
+                block[:, 0] = timestamps[written:written + rows]
+                # Fill in channel data, trimmed to the common minimum length
+                for ch in range(num_sensors):
+                    block[:, ch + 1] = recording_array[ch, written:written + rows]
+                block.tofile(bin_file)
+                written += rows
         print(f"Binary data saved to {bin_filename}")
-        print(f"Data shape: {data_matrix.shape} (samples, channels+1)")
+        print(f"Data shape: ({min_samples}, {expected_channels + 1}) (samples, channels+1)")
         
         # Verify data format
         print(f"First few timestamps: {timestamps[:5]}")
@@ -105,12 +113,26 @@ def save_emg_recording(save_directory, recording_data_buffer, start_time, sampli
         return False, f"Error saving recording: {str(e)}", 0
 
 
+# Timestamp ramps per sampling rate: trials at the same rate share one
+# arange and take prefix views instead of allocating a fresh array per save
+_ts_cache = {}
+
+
 def generate_timestamps(num_samples, start_time, sampling_rate):
-    """Generate relative timestamps starting from 0."""
+    """Generate relative timestamps starting from 0.
+
+    Returns a read-only prefix view of a cached ramp; callers that need to
+    mutate it must copy. The start_time parameter is not used in this
+    implementation but kept for compatibility.
+    """
     # Always generate relative timestamps starting from 0
     # This matches the format expected by MATLAB and used in debug_data_saver.py
-    # The start_time parameter is not used in this implementation but kept for compatibility
-    return np.arange(num_samples, dtype=np.float64) / sampling_rate
+    ramp = _ts_cache.get(sampling_rate)
+    if ramp is None or ramp.shape[0] < num_samples:
+        ramp = np.arange(num_samples, dtype=np.float64) / sampling_rate
+        ramp.flags.writeable = False
+        _ts_cache[sampling_rate] = ramp
+    return ramp[:num_samples]
 
 
 def save_metadata(meta_filename, num_sensors, sampling_rate, muscle_labels, 
@@ -127,6 +149,9 @@ def save_metadata(meta_filename, num_sensors, sampling_rate, muscle_labels,
         meta_data['session_date'] = recording_session_start_time.strftime("%Y-%m-%d")
         meta_data['session_time'] = recording_session_start_time.strftime("%H:%M:%S")
         meta_data['trial_number'] = int(trial_counter)
+        # Binary files are raw little-endian float32, (samples, channels+1)
+        meta_data['dtype'] = 'float32'
+        meta_data['byte_order'] = 'little'
         
         scipy.io.savemat(meta_filename, {'meta_data': meta_data}, format='5')
         print(f"Metadata saved to {meta_filename}")
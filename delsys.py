@@ -1,25 +1,140 @@
 """Delsys Trigno system handler for EMG data streaming."""
 
 import socket
-import struct
+import selectors
 import threading
 import time
 import numpy as np
 import queue
+from typing import NamedTuple
 from scipy import signal
 
+try:
+    # Optional JIT for the biquad inner loop; scipy.lfilter is the fallback
+    from numba import njit
+except ImportError:
+    njit = None
+
 from config import (
-    EMG_COMMAND_PORT, 
-    EMG_STREAM_PORT, 
-    ACTIVE_CHANNELS, 
+    EMG_COMMAND_PORT,
+    EMG_STREAM_PORT,
+    ACTIVE_CHANNELS,
     SAMPLING_RATE,
     NOTCH_FREQ,
     NOTCH_Q,
-    HP_FREQ
+    HP_FREQ,
+    EMG_BATCH_FRAMES
 )
 from utils import load_muscle_labels
 
 
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _sos_block(x, sos, z):
+        """Second-order-section cascade over a (channels, n) block.
+
+        Runs every section of every channel in one compiled call,
+        transposed direct-form II, filtering x and updating the
+        (sections, channels, 2) state in place. Adding more stages
+        (e.g. harmonic notches) only grows the sos array.
+        """
+        sections = sos.shape[0]
+        channels, n = x.shape
+        for s in range(sections):
+            b0, b1, b2 = sos[s, 0], sos[s, 1], sos[s, 2]
+            a1, a2 = sos[s, 4], sos[s, 5]
+            for c in range(channels):
+                z0 = z[s, c, 0]
+                z1 = z[s, c, 1]
+                for i in range(n):
+                    xi = x[c, i]
+                    y = b0 * xi + z0
+                    z0 = b1 * xi - a1 * y + z1
+                    z1 = b2 * xi - a2 * y
+                    x[c, i] = y
+                z[s, c, 0] = z0
+                z[s, c, 1] = z1
+else:
+    _sos_block = None
+
+
+# Filter coefficients keyed by sampling rate; the design parameters are
+# config constants, so each rate only needs one iirnotch/butter call
+_filter_cache = {}
+
+
+class EmgBatch(NamedTuple):
+    """One published window of processed samples.
+
+    Cheaper to build and smaller than the dict it replaces, which matters
+    with up to 1000 of them queued in the output ring.
+    """
+    samples: np.ndarray  # (channels, batch_frames) float32, rectified
+    labels: list         # per-channel muscle labels
+    timestamp: float     # wall-clock time the window was completed
+
+
+class SpscRing:
+    """
+    Single-producer/single-consumer ring buffer for handler output.
+
+    The stream worker is the only producer and the recording worker the only
+    consumer, so head/tail are plain ints whose updates are atomic under the
+    GIL; steady-state push/pop take no locks. A threading.Event is used for
+    wakeup only on the empty -> non-empty transition, so the mutex and
+    condition variables of queue.Queue are avoided on every message.
+    """
+
+    def __init__(self, capacity=1000):
+        self._slots = [None] * capacity
+        self._capacity = capacity
+        self._head = 0  # next slot to read (consumer-owned)
+        self._tail = 0  # next slot to write (producer-owned)
+        self._ready = threading.Event()
+
+    def put_nowait(self, item):
+        """Producer side: append an item, dropping the oldest when full."""
+        head = self._head
+        tail = self._tail
+        if tail - head >= self._capacity:
+            # Full: drop the oldest item (same policy as the bounded queue).
+            # Overflow already means data loss, so the benign race with the
+            # consumer here costs at most one extra dropped chunk.
+            self._head = head + 1
+        self._slots[tail % self._capacity] = item
+        self._tail = tail + 1
+        if tail == head:
+            self._ready.set()
+
+    def get(self, timeout=None):
+        """Consumer side: pop the oldest item, blocking up to timeout."""
+        if self._head == self._tail:
+            self._ready.clear()
+            # Re-check after clearing to avoid a missed wakeup
+            if self._head == self._tail and not self._ready.wait(timeout):
+                raise queue.Empty
+        head = self._head
+        slot = head % self._capacity
+        item = self._slots[slot]
+        self._slots[slot] = None
+        self._head = head + 1
+        return item
+
+    def get_nowait(self):
+        """Consumer side: pop the oldest item or raise queue.Empty."""
+        if self._head == self._tail:
+            raise queue.Empty
+        head = self._head
+        slot = head % self._capacity
+        item = self._slots[slot]
+        self._slots[slot] = None
+        self._head = head + 1
+        return item
+
+    def qsize(self):
+        return self._tail - self._head
+
+
 class DelsysDataHandler:
     """
     Handles connection and data streaming from Delsys Trigno system
@@ -43,8 +158,20 @@ class DelsysDataHandler:
         self.streaming = False
         self.stream_thread = None
         
-        # Output queue for processed data
-        self.output_queue = queue.Queue(maxsize=1000)
+        # Output ring for processed data (stream worker -> recording worker)
+        self.output_queue = SpscRing(capacity=1000)
+
+        # Frames are accumulated into one (channels, batch_frames) batch per
+        # publish, so the ring carries one message per time window instead of
+        # one dict per channel per frame
+        self.batch_frames = EMG_BATCH_FRAMES
+        self._batch = np.empty((ACTIVE_CHANNELS, self.batch_frames), dtype=np.float32)
+        self._batch_fill = 0
+
+        # Receive buffer: one recv_into call pulls as many 64-byte frames as
+        # the kernel has queued, instead of one syscall per frame at 2 kHz
+        self._rxbuf = bytearray(65536)
+        self._rxview = memoryview(self._rxbuf)
         
         # Signal processing elements
         self._design_filters()
@@ -52,49 +179,67 @@ class DelsysDataHandler:
         
         # Load muscle labels from YAML configuration file
         self.muscle_labels = load_muscle_labels()
+
+        # Labels padded to the active channel count once, so packets never
+        # format fallback names on the hot path
+        self._labels = [
+            self.muscle_labels[i] if i < len(self.muscle_labels) else f'Ch{i}'
+            for i in range(self.active_channels)
+        ]
         
     def _design_filters(self):
-        """Design the filters needed for signal processing"""
-        # Design 60Hz notch filter
+        """Attach filter coefficients, designing them once per sampling rate.
+
+        The design parameters are config constants, so iirnotch/butter only
+        need to run on the first instance for a given rate; reconnects reuse
+        the cached float32 coefficient arrays.
+        """
         self.notch_freq = NOTCH_FREQ
-        Q = NOTCH_Q  # Quality factor for the notch filter
-        b, a = signal.iirnotch(self.notch_freq, Q, self.sampling_rate)
-        self.notch_b = b
-        self.notch_a = a
-        
-        # Design DC removal filter (High-pass at 0.5Hz)
         self.hp_freq = HP_FREQ
-        hp_b, hp_a = signal.butter(2, self.hp_freq / (self.sampling_rate / 2), 'high')
-        self.dc_block_b = hp_b
-        self.dc_block_a = hp_a
-    
+        cached = _filter_cache.get(self.sampling_rate)
+        if cached is None:
+            # Design 60Hz notch filter
+            b, a = signal.iirnotch(self.notch_freq, NOTCH_Q, self.sampling_rate)
+            # Design DC removal filter (High-pass at 0.5Hz)
+            hp_b, hp_a = signal.butter(2, self.hp_freq / (self.sampling_rate / 2), 'high')
+            # Coefficients are designed in float64 but stored as float32:
+            # the source samples are float32, so the whole pipeline stays
+            # in the input precision and the filter state is half the size
+            # Fuse the cascade into second-order sections (high-pass first,
+            # then notch) so filtering is a single call over all stages
+            sos = np.vstack([np.hstack([hp_b, hp_a]),
+                             np.hstack([b, a])]).astype(np.float32)
+            cached = (b.astype(np.float32), a.astype(np.float32),
+                      hp_b.astype(np.float32), hp_a.astype(np.float32), sos)
+            _filter_cache[self.sampling_rate] = cached
+        (self.notch_b, self.notch_a,
+         self.dc_block_b, self.dc_block_a, self.sos) = cached
+
     def _initialize_filter_states(self):
-        """Initialize filter states for each channel"""
-        self.notch_zi = {}
-        self.dc_block_zi = {}
-        for ch in range(self.active_channels):
-            # Initialize filter states to zero
-            self.notch_zi[ch] = signal.lfilter_zi(self.notch_b, self.notch_a)
-            self.dc_block_zi[ch] = signal.lfilter_zi(self.dc_block_b, self.dc_block_a)
-    
-    def _process_emg_sample(self, sample_value, channel_id):
-        """Apply signal processing to a single EMG sample"""
-        # Apply DC removal (high-pass filter)
-        dc_removed, self.dc_block_zi[channel_id] = signal.lfilter(
-            self.dc_block_b, self.dc_block_a, [sample_value], zi=self.dc_block_zi[channel_id]
-        )
-        dc_removed = dc_removed[0]
-        
-        # Apply 60Hz notch filter
-        notched, self.notch_zi[channel_id] = signal.lfilter(
-            self.notch_b, self.notch_a, [dc_removed], zi=self.notch_zi[channel_id]
-        )
-        notched = notched[0]
-        
-        # Apply rectification
-        rectified = abs(notched)
-        
-        return rectified
+        """Initialize per-section, per-channel filter state (DF2 transposed)"""
+        self.sos_z = np.zeros((self.sos.shape[0], self.active_channels, 2),
+                              dtype=np.float32)
+
+    def _process_block(self, block):
+        """Apply signal processing to one (channels, n) block of samples.
+
+        The whole cascade (high-pass + notch) runs as one second-order-
+        section pass over every channel in the batch, so the dispatch cost
+        is paid once per window regardless of how many stages the cascade
+        grows to. Uses the compiled kernel when numba is installed, else
+        a single vectorized sosfilt call.
+        """
+        if _sos_block is not None:
+            # JIT path: one compiled in-place pass over all sections
+            out = block.copy()
+            _sos_block(out, self.sos, self.sos_z)
+            return np.abs(out, out=out)
+
+        filtered, self.sos_z = signal.sosfilt(
+            self.sos, block, axis=-1, zi=self.sos_z)
+
+        # Apply rectification (in place; sosfilt already returned a copy)
+        return np.abs(filtered, out=filtered)
         
     def start_streaming(self):
         """Start the EMG data streaming"""
@@ -104,12 +249,18 @@ class DelsysDataHandler:
             # Create command socket
             self.command_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.command_socket.settimeout(10.0)
+            # Commands are tiny; don't let Nagle delay them
+            self.command_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.command_socket.connect((self.host_ip, self.EMG_COMMAND_PORT))
             print(f"Command socket connected to port {self.EMG_COMMAND_PORT}")
-            
+
             # Create stream socket
             self.stream_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.stream_socket.settimeout(10.0)
+            # A 1 MiB kernel receive buffer (~4 s of frames) rides out GC or
+            # scheduler stalls without the sender dropping data
+            self.stream_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            self.stream_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.stream_socket.connect((self.host_ip, self.EMG_STREAM_PORT))
             print(f"Stream socket connected to port {self.EMG_STREAM_PORT}")
             
@@ -136,56 +287,84 @@ class DelsysDataHandler:
     def _stream_worker(self):
         """Worker thread to continuously read EMG data"""
         print("🔄 EMG stream worker started")
-        
+
+        FRAME_BYTES = 64  # 16 little-endian float32s per protocol frame
+
+        # Hoist hot-loop lookups to locals (self.streaming is re-read each
+        # iteration on purpose; stop_streaming flips it from another thread)
+        rxbuf = self._rxbuf
+        rxview = self._rxview
+        rxlen = 0
+        batch = self._batch
+        batch_fill = self._batch_fill
+        batch_frames = self.batch_frames
+        active_channels = self.active_channels
+        labels = self._labels
+        process_block = self._process_block
+        put_packet = self.output_queue.put_nowait
+        now = time.time
+        frombuffer = np.frombuffer
+
+        # Wait for readiness with a selector rather than a socket timeout:
+        # idle periods cost a select() return instead of a raised
+        # socket.timeout, and stop_streaming is noticed within 0.25 s
+        sock = self.stream_socket
+        sock.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+
         try:
             while self.streaming and self.stream_socket:
                 try:
-                    # Read 64 bytes (16 floats) as per protocol
-                    emg_byte_data = self.stream_socket.recv(64)
-                    
-                    if len(emg_byte_data) != 64:
-                        print(f"Warning: Received {len(emg_byte_data)} bytes, expected 64")
+                    if not selector.select(timeout=0.25):
+                        continue
+
+                    # Pull whatever the kernel has buffered in one syscall
+                    n = sock.recv_into(rxview[rxlen:])
+                    if n == 0:
+                        print("Stream socket closed by peer")
+                        break
+                    rxlen += n
+
+                    num_frames = rxlen // FRAME_BYTES
+                    if num_frames == 0:
                         continue
-                    
-                    # Unpack as 16 little-endian floats
-                    emg_data = struct.unpack('<16f', emg_byte_data)
-                    
-                    # Process only the first 4 channels
-                    for channel_id in range(self.active_channels):
-                        sample_value = emg_data[channel_id]
-                        
-                        # Apply signal processing
-                        processed_value = self._process_emg_sample(sample_value, channel_id)
-                        
-                        # Create processed data packet
-                        processed_data = {
-                            'channel': channel_id,
-                            'samples': np.array([processed_value], dtype=np.float64),
-                            'muscle_label': self.muscle_labels[channel_id] if channel_id < len(self.muscle_labels) else f'Ch{channel_id}',
-                            'timestamp': time.time()
-                        }
-                        
-                        # Add to output queue (non-blocking)
-                        try:
-                            self.output_queue.put_nowait(processed_data)
-                        except queue.Full:
-                            # Remove oldest item and add new one
-                            try:
-                                self.output_queue.get_nowait()
-                                self.output_queue.put_nowait(processed_data)
-                            except queue.Empty:
-                                pass
-                
-                except socket.timeout:
+
+                    # View the complete frames as a (frames, 16) float32 array
+                    frames = frombuffer(
+                        rxbuf, dtype='<f4', count=num_frames * 16
+                    ).reshape(num_frames, 16)
+
+                    for frame in frames:
+                        # Stash the raw frame; filtering runs once per batch
+                        batch[:, batch_fill] = frame[:active_channels]
+                        batch_fill += 1
+
+                        # Publish one packet per full time window
+                        # (output ring drops the oldest when full)
+                        if batch_fill == batch_frames:
+                            put_packet(EmgBatch(process_block(batch), labels, now()))
+                            batch_fill = 0
+
+                    # Move any partial trailing frame to the front
+                    consumed = num_frames * FRAME_BYTES
+                    remainder = rxlen - consumed
+                    if remainder:
+                        rxview[:remainder] = rxview[consumed:rxlen]
+                    rxlen = remainder
+
+                except BlockingIOError:
+                    # Spurious readiness; go back to waiting
                     continue
                 except Exception as e:
                     if self.streaming:
                         print(f"Stream worker error: {e}")
                     break
-                    
+
         except Exception as e:
             print(f"❌ Stream worker fatal error: {e}")
         finally:
+            selector.close()
             print("🔄 EMG stream worker stopped")
     
     def stop_streaming(self):
@@ -1,7 +1,9 @@
 # delsys_simulator.py - Realistic Delsys Trigno System Simulator with sub-millivolt signals
 
+import collections
+import os
 import socket
-import struct
+import selectors
 import threading
 import time
 import numpy as np
@@ -9,6 +11,56 @@ import signal
 import sys
 from datetime import datetime
 
+try:
+    # Optional JIT for block synthesis; the NumPy broadcasts are the fallback
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    # Serial on purpose: the kernel runs on the daemon generator thread, and
+    # numba's parallel runtime can't finalize when first initialized off the
+    # main thread (the process hangs at exit). A fork/join per (64, 16)
+    # block would cost more than the loop anyway.
+    @njit(fastmath=True, cache=True)
+    def _synth_block(out, idx, t, lut, period, k_main, k_13, k_07, k_21,
+                     k_burst, k_slow1, k_slow2, bases, fatigues,
+                     contraction, rand_mix, base_noise, dc_offset):
+        """Write one (block, channels) EMG block into out.
+
+        All randomness is drawn outside and passed in as arrays, and every
+        sinusoid is an integer-indexed load from the shared LUT, so the
+        kernel is a pure index/multiply/clip loop that LLVM can vectorize.
+        """
+        block, channels = out.shape
+        for i in range(block):
+            n = idx[i]
+            ti = t[i]
+            slow = (1.0 + 0.3 * lut[(n * k_slow1) % period]
+                    + 0.2 * lut[(n * k_slow2) % period])
+            for c in range(channels):
+                if k_main[c] == 0:
+                    # Inactive ('NC') channels carry baseline noise only
+                    out[i, c] = base_noise[i, c]
+                    continue
+                s = abs(lut[(n * k_main[c]) % period]
+                        + 0.6 * lut[(n * k_13[c]) % period]
+                        + 0.4 * lut[(n * k_07[c]) % period]
+                        + 0.3 * lut[(n * k_21[c]) % period]
+                        + 0.2 * rand_mix[i, c])
+                burst = 1.0 + 0.4 * lut[(n * k_burst[c]) % period]
+                fatigue = fatigues[c] ** (ti / 60.0)
+                v = (s * bases[c] * slow * burst * contraction[i, c]
+                     * fatigue + base_noise[i, c] + dc_offset[i, c])
+                if v > 1e-3:
+                    v = 1e-3
+                elif v < -1e-3:
+                    v = -1e-3
+                out[i, c] = v
+else:
+    _synth_block = None
+
 class DelsysSimulator:
     """
     Simulates a Delsys Trigno system for testing EMG data collection applications.
@@ -28,24 +80,82 @@ class DelsysSimulator:
         # Server sockets
         self.command_server = None
         self.stream_server = None
+        # Optional Unix-domain stream endpoint for same-host clients
+        self.stream_unix_server = None
+        self.STREAM_SOCKET_PATH = f"/tmp/delsys_{self.STREAM_PORT}.sock"
         
         # Client connections
         self.command_conn = None
         self.stream_conn = None
+        # Unparsed bytes from the command client; commands can arrive
+        # coalesced or split across reads, so they're tokenized from this
+        # buffer rather than per recv
+        self._cmd_buf = b''
         
         # Control flags
         self.running = False
         self.streaming = False
         self.trigger_active = False
         
-        # Threads
-        self.command_thread = None
-        self.stream_thread = None
+        # Threads: one selector loop services every socket; the data
+        # generator keeps its own thread for the CPU-bound synthesis
+        self.server_thread = None
         self.data_thread = None
+        self.log_thread = None
+        self._selector = None
+
+        # Hot-path log lines are queued here and drained by a background
+        # thread, so the data generator never blocks on a slow stdout
+        self._log_q = collections.deque(maxlen=256)
         
         # EMG simulation parameters
+        # One PCG64 Generator for all draws: batched Generator calls are
+        # much cheaper than the legacy np.random scalar functions
+        self._rng = np.random.default_rng()
         self.time_offset = 0.0
-        self.muscle_profiles = self._create_muscle_profiles()
+        self._create_muscle_profiles()
+
+        # Samples synthesized (and sent) per block; 64 samples = 32 ms at
+        # 2 kHz, so synthesis runs as array math instead of a per-sample loop
+        self.block_samples = 64
+
+        # Persistent transmit buffer: blocks are written into this
+        # (block, 16) float32 array and sent from its memory directly,
+        # so no bytes object is built per block
+        self._tx = np.empty((self.block_samples, 16), dtype='<f4')
+
+        # Shared sine lookup table: every component frequency is quantized
+        # to a 0.05 Hz grid, so one 20-second period covers all of them and
+        # each sin() evaluation becomes an integer-indexed load. Per
+        # component, sample n reads lut[(n * k) % period] where k is the
+        # frequency in grid steps.
+        lut_res = 0.05
+        self._lut_period = int(round(self.sampling_rate / lut_res))
+        self._sin_lut = np.sin(
+            2 * np.pi * np.arange(self._lut_period) / self._lut_period)
+        self._k_main = np.rint(self._freqs / lut_res).astype(np.int64)
+        self._k_13 = np.rint(1.3 * self._freqs / lut_res).astype(np.int64)
+        self._k_07 = np.rint(0.7 * self._freqs / lut_res).astype(np.int64)
+        self._k_21 = np.rint(2.1 * self._freqs / lut_res).astype(np.int64)
+        self._k_burst = np.rint(self._bursts / lut_res).astype(np.int64)
+        self._k_slow1 = int(round(0.1 / lut_res))
+        self._k_slow2 = int(round(0.05 / lut_res))
+
+        # Strong contractions as a Poisson process: the old per-sample
+        # Bernoulli draw at threshold p fired at (1-p)*fs events/s, so
+        # schedule exponential inter-arrivals at that rate (in samples)
+        # and apply each event as a 50 ms raised-cosine gain envelope
+        rate = (1.0 - self._thresholds) * self.sampling_rate  # events/s
+        self._contraction_rate = rate
+        env_len = int(0.05 * self.sampling_rate)
+        self._env = 0.5 * (1.0 - np.cos(2 * np.pi * np.arange(env_len) / env_len))
+        self._env_pos = np.full(self.num_sensors, -1, dtype=np.int64)
+        self._env_gain = np.ones(self.num_sensors)
+        self._next_contraction = np.where(
+            rate > 0,
+            self._rng.exponential(1.0, self.num_sensors) / np.maximum(rate, 1e-12)
+            * self.sampling_rate,
+            np.inf)
         
         print(f"🎭 Realistic EMG Simulator initialized (sub-millivolt signals)")
         print(f"   Host: {self.host}")
@@ -56,118 +166,149 @@ class DelsysSimulator:
         print(f"   Signal Range: 10-800 µV (0.00001 - 0.0008 V)")
     
     def _create_muscle_profiles(self):
-        """Create realistic EMG signal profiles with sub-millivolt amplitudes"""
+        """Create realistic EMG signal profiles with sub-millivolt amplitudes.
+
+        Profiles are stored as per-channel arrays (struct-of-arrays) rather
+        than a dict of dicts, so block synthesis broadcasts over them
+        directly; names live in a plain list used only for logging.
+        'NC' (or unnamed) channels are unconnected and carry baseline
+        noise only. Typical EMG ranges: 10-800 µV for surface EMG.
+        """
         muscle_names = [
             'L-MASS', 'L-MYLO', 'R-MASS', 'R-MYLO'
         ]
-        
-        profiles = {}
-        for i, name in enumerate(muscle_names[:self.num_sensors]):
-            if 'NC' in name:
-                # No connection - just baseline noise (5-15 µV)
-                profiles[i] = {
-                    'name': name,
-                    'base_amplitude': np.random.uniform(5e-6, 15e-6),
-                    'frequency': 0.0,
-                    'burst_frequency': 0.0,
-                    'noise_level': np.random.uniform(3e-6, 8e-6),
-                    'max_activation': 0.0
-                }
-            else:
-                # Active muscle with realistic EMG parameters
-                # Typical EMG ranges: 10-800 µV for surface EMG
-                base_activation = np.random.uniform(20e-6, 80e-6)
-                max_activation = np.random.uniform(200e-6, 800e-6)
-                
-                profiles[i] = {
-                    'name': name,
-                    'base_amplitude': base_activation,
-                    'frequency': np.random.uniform(80, 120),
-                    'burst_frequency': np.random.uniform(0.3, 1.5),
-                    'noise_level': np.random.uniform(8e-6, 20e-6),
-                    'max_activation': max_activation,
-                    'contraction_threshold': np.random.uniform(0.998, 0.9995),
-                    'fatigue_factor': np.random.uniform(0.95, 0.99)
-                }
-                
-                print(f"   📊 {name}: Rest={base_activation*1e6:.1f}µV, Max={max_activation*1e6:.1f}µV")
-        
-        return profiles
+
+        count = self.num_sensors
+        rng = self._rng
+        self._names = [muscle_names[i] if i < len(muscle_names) else 'NC'
+                       for i in range(count)]
+        self.active = np.array(['NC' not in name for name in self._names])
+        active = self.active
+
+        self._freqs = np.where(active, rng.uniform(80, 120, count), 0.0)
+        self._bases = np.where(active,
+                               rng.uniform(20e-6, 80e-6, count),
+                               rng.uniform(5e-6, 15e-6, count))
+        self._noises = np.where(active,
+                                rng.uniform(8e-6, 20e-6, count),
+                                rng.uniform(3e-6, 8e-6, count))
+        self._bursts = np.where(active, rng.uniform(0.3, 1.5, count), 0.0)
+        self._maxes = np.where(active, rng.uniform(200e-6, 800e-6, count), 0.0)
+        # Inactive channels get a threshold above 1 so they never contract
+        self._thresholds = np.where(active, rng.uniform(0.998, 0.9995, count), 1.1)
+        self._fatigues = np.where(active, rng.uniform(0.95, 0.99, count), 1.0)
+
+        for i in np.flatnonzero(active):
+            print(f"   📊 {self._names[i]}: Rest={self._bases[i]*1e6:.1f}µV, "
+                  f"Max={self._maxes[i]*1e6:.1f}µV")
     
-    def _generate_emg_sample(self, channel_id, timestamp):
-        """Generate a realistic EMG sample with sub-millivolt amplitudes"""
-        if channel_id not in self.muscle_profiles:
-            # Fallback noise for undefined channels
-            return np.random.normal(0, 10e-6)
-        
-        profile = self.muscle_profiles[channel_id]
-        
-        # Base electrical noise (always present)
-        base_noise = np.random.normal(0, profile['noise_level'])
-        
-        if profile['frequency'] == 0.0:
-            return base_noise
-        
-        # Simulate realistic EMG signal characteristics
-        
+    def _contraction_block(self, idx):
+        """Multiplicative contraction gain for one block of sample indices.
+
+        Contraction onsets are pre-scheduled with exponential inter-arrivals
+        at the rate the old per-sample Bernoulli check implied, so the rare
+        event costs one RNG draw per occurrence instead of one per sample.
+        Each event applies a 50 ms raised-cosine envelope that may continue
+        into following blocks.
+        """
+        block = idx.shape[0]
+        i0 = int(idx[0])
+        end = i0 + block
+        mult = np.ones((block, self.num_sensors))
+        env = self._env
+        env_len = env.shape[0]
+        for c in range(self.num_sensors):
+            # Finish an envelope carried over from the previous block
+            pos = int(self._env_pos[c])
+            if pos >= 0:
+                n = min(env_len - pos, block)
+                mult[:n, c] = 1.0 + (self._env_gain[c] - 1.0) * env[pos:pos + n]
+                pos += n
+                self._env_pos[c] = pos if pos < env_len else -1
+
+            # Start any contractions scheduled inside this block
+            while self._next_contraction[c] < end:
+                start = max(int(self._next_contraction[c]) - i0, 0)
+                gain = 1.0 + self._rng.uniform(0.5, 1.0) * (
+                    self._maxes[c] / self._bases[c] - 1.0)
+                n = min(env_len, block - start)
+                mult[start:start + n, c] = 1.0 + (gain - 1.0) * env[:n]
+                self._env_gain[c] = gain
+                self._env_pos[c] = n if n < env_len else -1
+                self._log_q.append(f"💪 {self._names[c]}: Strong contraction! "
+                                   f"{self._bases[c] * gain * 1e6:.0f}µV")
+                self._next_contraction[c] += (
+                    self._rng.exponential(1.0 / self._contraction_rate[c])
+                    * self.sampling_rate)
+        return mult
+
+    def _generate_emg_block(self, t, idx):
+        """Generate realistic EMG for all channels over a block of timestamps.
+
+        t is a (block,) array of sample times and idx the matching absolute
+        sample indices (used to phase the sine LUT); returns a
+        (block, num_sensors) array of sub-millivolt samples. All the
+        per-sample math from the original scalar generator is expressed as
+        broadcasts over (samples, channels), so one call replaces
+        block * channels interpreter-level sample evaluations.
+        """
+        shape = (t.shape[0], self.num_sensors)
+
+        # All randomness is drawn here so the jitted kernel stays pure
+        base_noise = self._rng.standard_normal(shape) * self._noises
+        rand_mix = self._rng.random(shape)
+        dc_offset = self._rng.uniform(-50e-6, 50e-6, shape)
+
+        # Occasional strong contractions, pre-scheduled as a Poisson process
+        contraction_multiplier = self._contraction_block(idx)
+
+        if _synth_block is not None:
+            # JIT path: one compiled pass writing the block in place
+            out = np.empty(shape)
+            _synth_block(out, idx, t, self._sin_lut, self._lut_period,
+                         self._k_main, self._k_13, self._k_07, self._k_21,
+                         self._k_burst, self._k_slow1, self._k_slow2,
+                         self._bases, self._fatigues, contraction_multiplier,
+                         rand_mix, base_noise, dc_offset)
+            return out
+
+        tc = t[:, None]  # (block, 1) against (channels,) profile arrays
+        n = idx[:, None]
+        lut = self._sin_lut
+        period = self._lut_period
+
         # Main EMG frequency content (motor unit firing patterns)
         # Multiple frequency components to simulate motor unit recruitment
-        main_freq = profile['frequency']
-        emg_signal = (
-            np.sin(2 * np.pi * main_freq * timestamp) +
-            0.6 * np.sin(2 * np.pi * main_freq * 1.3 * timestamp) +
-            0.4 * np.sin(2 * np.pi * main_freq * 0.7 * timestamp) +
-            0.3 * np.sin(2 * np.pi * main_freq * 2.1 * timestamp) +
-            0.2 * np.random.random()
+        emg_signal = np.abs(
+            lut[(n * self._k_main) % period] +
+            0.6 * lut[(n * self._k_13) % period] +
+            0.4 * lut[(n * self._k_07) % period] +
+            0.3 * lut[(n * self._k_21) % period] +
+            0.2 * rand_mix
         )
-        
-        # Add DC offset to simulate real-world conditions
-        dc_offset = np.random.uniform(-50e-6, 50e-6)
-        
-        # Rectify and apply realistic amplitude modulation
-        emg_signal = np.abs(emg_signal)
-        
-        # Muscle activation level (varies over time)
-        # Base activation level
-        activation_level = profile['base_amplitude']
-        
-        # Add slow muscle activation variations (breathing, posture changes)
-        slow_modulation = 1.0 + 0.3 * np.sin(2 * np.pi * 0.1 * timestamp)
-        slow_modulation += 0.2 * np.sin(2 * np.pi * 0.05 * timestamp)
-        
-        # Add muscle burst patterns (voluntary or involuntary contractions)
-        burst_modulation = 1.0 + 0.4 * np.sin(2 * np.pi * profile['burst_frequency'] * timestamp)
-        
-        # Occasional strong contractions (very rare)
-        contraction_multiplier = 1.0
-        if np.random.random() > profile['contraction_threshold']:
-            # Strong contraction (reaches max activation)
-            contraction_strength = np.random.uniform(0.5, 1.0)
-            contraction_multiplier = 1.0 + contraction_strength * (
-                profile['max_activation'] / profile['base_amplitude'] - 1.0
-            )
-            print(f"💪 {profile['name']}: Strong contraction! "
-                  f"{activation_level * contraction_multiplier * 1e6:.0f}µV")
-        
-        # Apply fatigue factor (slight decrease over time)
-        fatigue_factor = profile['fatigue_factor'] ** (timestamp / 60.0)
-        
-        # Combine all components
-        final_amplitude = (
-            activation_level * 
-            slow_modulation * 
-            burst_modulation * 
-            contraction_multiplier * 
-            fatigue_factor
-        )
-        
-        # Apply to EMG signal and add noise and DC offset
-        final_signal = emg_signal * final_amplitude + base_noise + dc_offset
-        
-        # Ensure signal stays within realistic bounds (never above 1mV)
-        final_signal = np.clip(final_signal, -1e-3, 1e-3)
-        
-        return final_signal
+
+        # Slow muscle activation variations (breathing, posture changes)
+        slow_modulation = (1.0 + 0.3 * lut[(n * self._k_slow1) % period]
+                           + 0.2 * lut[(n * self._k_slow2) % period])
+
+        # Muscle burst patterns (voluntary or involuntary contractions)
+        burst_modulation = 1.0 + 0.4 * lut[(n * self._k_burst) % period]
+
+        # Fatigue factor (slight decrease over time)
+        fatigue_factor = self._fatigues ** (tc / 60.0)
+
+        final_signal = (emg_signal * self._bases * slow_modulation
+                        * burst_modulation * contraction_multiplier
+                        * fatigue_factor + base_noise + dc_offset)
+
+        # Inactive ('NC') channels carry baseline noise only
+        inactive = self._freqs == 0.0
+        if inactive.any():
+            final_signal[:, inactive] = base_noise[:, inactive]
+
+        # Ensure signals stay within realistic bounds (never above 1mV);
+        # clip in place rather than allocating another block-sized array
+        return np.clip(final_signal, -1e-3, 1e-3, out=final_signal)
     
     def start(self):
         """Start the simulator servers"""
@@ -185,14 +326,35 @@ class DelsysSimulator:
             self.stream_server.bind((self.host, self.STREAM_PORT))
             self.stream_server.listen(1)
             
+            # Same-host clients can skip the TCP stack entirely by
+            # connecting to this Unix-domain socket instead
+            if self.host == '127.0.0.1' and hasattr(socket, 'AF_UNIX'):
+                try:
+                    if os.path.exists(self.STREAM_SOCKET_PATH):
+                        os.unlink(self.STREAM_SOCKET_PATH)
+                    self.stream_unix_server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self.stream_unix_server.bind(self.STREAM_SOCKET_PATH)
+                    self.stream_unix_server.listen(1)
+                except Exception as e:
+                    print(f"⚠️  Unix stream socket unavailable: {e}")
+                    self.stream_unix_server = None
+
             self.running = True
-            
-            # Start server threads
-            self.command_thread = threading.Thread(target=self._command_server_worker, daemon=True)
-            self.stream_thread = threading.Thread(target=self._stream_server_worker, daemon=True)
-            
-            self.command_thread.start()
-            self.stream_thread.start()
+
+            # Accepts happen from the selector loop, so the listen
+            # sockets must not block
+            self.command_server.setblocking(False)
+            self.stream_server.setblocking(False)
+            if self.stream_unix_server:
+                self.stream_unix_server.setblocking(False)
+
+            # One selector loop replaces the per-socket server threads
+            self.server_thread = threading.Thread(target=self._server_worker, daemon=True)
+            self.server_thread.start()
+
+            # Background drain for hot-path log lines
+            self.log_thread = threading.Thread(target=self._log_flusher_worker, daemon=True)
+            self.log_thread.start()
             
             print(f"✅ Command server listening on {self.host}:{self.COMMAND_PORT}")
             print(f"✅ Stream server listening on {self.host}:{self.STREAM_PORT}")
@@ -205,190 +367,244 @@ class DelsysSimulator:
             self.stop()
             return False
     
-    def _command_server_worker(self):
-        """Handle command connections and protocol"""
-        print("🎮 Command server worker started")
-        
-        while self.running:
-            try:
-                # Accept connection
-                print("⏳ Waiting for command connection...")
-                self.command_conn, addr = self.command_server.accept()
-                print(f"🔗 Command client connected from {addr}")
-                
-                # Handle commands from this client
-                while self.running and self.command_conn:
+    def _server_worker(self):
+        """Service every socket from one selector (epoll) loop.
+
+        Replaces the two blocking per-socket threads: accepts, command
+        reads and disconnect detection are all dispatched from a single
+        select call, so idle periods cost one kernel wait instead of
+        timeout-driven wakeups on two threads.
+        """
+        print("🎮 Server worker started (selector loop)")
+
+        selector = selectors.DefaultSelector()
+        self._selector = selector
+        selector.register(self.command_server, selectors.EVENT_READ, self._accept_command)
+        selector.register(self.stream_server, selectors.EVENT_READ, self._accept_stream)
+        if self.stream_unix_server:
+            selector.register(self.stream_unix_server, selectors.EVENT_READ, self._accept_stream)
+            print(f"🔌 Unix stream socket available at {self.STREAM_SOCKET_PATH}")
+        print("⏳ Waiting for client connections...")
+
+        try:
+            while self.running:
+                for key, _ in selector.select(timeout=0.5):
+                    key.data(key.fileobj)
+        except Exception as e:
+            if self.running:
+                print(f"❌ Error in server worker: {e}")
+        finally:
+            selector.close()
+            self._selector = None
+
+        print("🎮 Server worker stopped")
+
+    def _accept_command(self, server):
+        """Accept a command client and watch it for commands"""
+        conn, addr = server.accept()
+        print(f"🔗 Command client connected from {addr}")
+        if self.command_conn:
+            self._drop_client(self.command_conn)
+        conn.setblocking(False)
+        self.command_conn = conn
+        self._cmd_buf = b''
+        self._selector.register(conn, selectors.EVENT_READ, self._read_command)
+
+    def _accept_stream(self, server):
+        """Accept a stream client; the data generator writes to it"""
+        conn, addr = server.accept()
+        print(f"🔗 Stream client connected from {addr}")
+        if self.stream_conn:
+            self._drop_client(self.stream_conn)
+        # Each block should leave as one burst: disable Nagle, and give
+        # the kernel ~1 MiB of send buffer so a momentarily slow client
+        # doesn't stall the generator inside sendall (Unix-domain
+        # connections have no Nagle to disable)
+        if conn.family != getattr(socket, 'AF_UNIX', None):
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # Keepalive probes catch a vanished peer (cable pull, crash)
+            # that would otherwise never surface as readable in the
+            # selector; ~60 s to declare the client dead on Linux
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            for opt, value in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10),
+                               ('TCP_KEEPCNT', 3)):
+                if hasattr(socket, opt):
+                    conn.setsockopt(socket.IPPROTO_TCP, getattr(socket, opt), value)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        # The connection stays blocking for the data generator's sendall;
+        # it is registered read-only so a disconnect surfaces as readable
+        self._selector.register(conn, selectors.EVENT_READ, self._read_stream_client)
+        self.stream_conn = conn
+
+    # Known wire commands, longest first so 'TRIGGER START'/'TRIGGER STOP'
+    # win over their 'START'/'STOP' suffixes
+    _COMMAND_TOKENS = (b'TRIGGER START', b'TRIGGER STOP', b'START', b'STOP')
+
+    def _read_command(self, conn):
+        """Drain available bytes and dispatch every complete command in them.
+
+        TCP gives no message boundaries: back-to-back sends from the
+        handler (e.g. 'START' + 'TRIGGER START\\r\\n\\r\\n') can arrive
+        coalesced in one read as 'STARTTRIGGER START', or a command can be
+        split across reads. Bytes accumulate in _cmd_buf and every known
+        token is matched off the front, however the segments arrived.
+        """
+        try:
+            data = conn.recv(1024)
+        except Exception as e:
+            print(f"❌ Error in command handler: {e}")
+            data = b''
+
+        if not data:
+            print("🔌 Command client disconnected")
+            self._drop_client(conn)
+            return
+
+        self._cmd_buf += data
+        while True:
+            buf = self._cmd_buf.lstrip(b'\r\n ')
+            for token in self._COMMAND_TOKENS:
+                if buf.startswith(token):
+                    self._cmd_buf = buf[len(token):]
+                    self._process_command(token.decode(), conn)
+                    break
+            else:
+                if buf and not any(token.startswith(buf) for token in self._COMMAND_TOKENS):
+                    # Not a command and not the start of one: discard
+                    print(f"❓ Unknown command bytes: {buf!r}")
+                    buf = b''
                     try:
-                        # Receive command with timeout
-                        self.command_conn.settimeout(1.0)
-                        data = self.command_conn.recv(1024)
-                        
-                        if not data:
-                            print("🔌 Command client disconnected")
-                            break
-                        
-                        command = data.decode('utf-8', errors='ignore').strip()
-                        print(f"📨 Received command: '{command}'")
-                        
-                        # Process commands
-                        if command == 'START':
-                            print("▶️  Processing START command")
-                            self.streaming = True
-                            # Send acknowledgment
-                            try:
-                                self.command_conn.send(b'OK\r\n')
-                            except:
-                                pass
-                        
-                        elif command.startswith('TRIGGER START'):
-                            print("🎯 Processing TRIGGER START command")
-                            self.trigger_active = True
-                            if not self.data_thread or not self.data_thread.is_alive():
-                                self.data_thread = threading.Thread(target=self._data_generator_worker, daemon=True)
-                                self.data_thread.start()
-                            # Send acknowledgment
-                            try:
-                                self.command_conn.send(b'OK\r\n')
-                            except:
-                                pass
-                        
-                        elif command.startswith('TRIGGER STOP'):
-                            print("🛑 Processing TRIGGER STOP command")
-                            self.trigger_active = False
-                            # Send acknowledgment
-                            try:
-                                self.command_conn.send(b'OK\r\n')
-                            except:
-                                pass
-                        
-                        elif command == 'STOP':
-                            print("⏹️  Processing STOP command")
-                            self.streaming = False
-                            self.trigger_active = False
-                            # Send acknowledgment
-                            try:
-                                self.command_conn.send(b'OK\r\n')
-                            except:
-                                pass
-                        
-                        else:
-                            print(f"❓ Unknown command: '{command}'")
-                            # Send acknowledgment anyway
-                            try:
-                                self.command_conn.send(b'OK\r\n')
-                            except:
-                                pass
-                    
-                    except socket.timeout:
-                        continue
-                    except Exception as e:
-                        print(f"❌ Error in command handler: {e}")
-                        break
-            
-            except Exception as e:
-                if self.running:
-                    print(f"❌ Error in command server: {e}")
-                    time.sleep(1)
-        
-        print("🎮 Command server worker stopped")
+                        conn.send(b'OK\r\n')
+                    except:
+                        pass
+                # Empty, or an incomplete token awaiting its next segment
+                self._cmd_buf = buf
+                return
+
+    def _process_command(self, command, conn):
+        """Apply one parsed command and acknowledge it"""
+        print(f"📨 Received command: '{command}'")
+
+        if command == 'START':
+            print("▶️  Processing START command")
+            self.streaming = True
+
+        elif command == 'TRIGGER START':
+            print("🎯 Processing TRIGGER START command")
+            self.trigger_active = True
+            if not self.data_thread or not self.data_thread.is_alive():
+                self.data_thread = threading.Thread(target=self._data_generator_worker, daemon=True)
+                self.data_thread.start()
+
+        elif command == 'TRIGGER STOP':
+            print("🛑 Processing TRIGGER STOP command")
+            self.trigger_active = False
+
+        elif command == 'STOP':
+            print("⏹️  Processing STOP command")
+            self.streaming = False
+            self.trigger_active = False
+
+        # Send acknowledgment
+        try:
+            conn.send(b'OK\r\n')
+        except:
+            pass
+
+    def _read_stream_client(self, conn):
+        """The stream client never sends data; readability means it's gone"""
+        try:
+            data = conn.recv(1)
+        except Exception:
+            data = b''
+        if not data:
+            print("🔌 Stream client disconnected")
+            self._drop_client(conn)
+
+    def _drop_client(self, conn):
+        """Unregister and close a client connection"""
+        try:
+            self._selector.unregister(conn)
+        except Exception:
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+        if self.command_conn is conn:
+            self.command_conn = None
+        if self.stream_conn is conn:
+            self.stream_conn = None
     
-    def _stream_server_worker(self):
-        """Handle stream connections"""
-        print("📡 Stream server worker started")
-        
+    def _log_flusher_worker(self):
+        """Drain queued hot-path log lines to stdout twice a second"""
         while self.running:
-            try:
-                # Accept connection
-                print("⏳ Waiting for stream connection...")
-                self.stream_conn, addr = self.stream_server.accept()
-                print(f"🔗 Stream client connected from {addr}")
-                
-                # Keep connection alive while running
-                while self.running and self.stream_conn:
-                    try:
-                        # Just keep the connection alive
-                        # The actual data sending is handled by the data generator
-                        time.sleep(1.0)
-                        
-                        # Check if client is still connected
-                        self.stream_conn.settimeout(0.1)
-                        try:
-                            ready = self.stream_conn.recv(1, socket.MSG_PEEK)
-                            if not ready:
-                                print("🔌 Stream client disconnected")
-                                break
-                        except socket.timeout:
-                            # This is expected - client is just listening
-                            pass
-                        except:
-                            print("🔌 Stream client disconnected")
-                            break
-                            
-                    except Exception as e:
-                        print(f"❌ Error maintaining stream connection: {e}")
-                        break
-            
-            except Exception as e:
-                if self.running:
-                    print(f"❌ Error in stream server: {e}")
-                    time.sleep(1)
-        
-        print("📡 Stream server worker stopped")
-    
+            time.sleep(0.5)
+            while True:
+                try:
+                    print(self._log_q.popleft())
+                except IndexError:
+                    break
+
     def _data_generator_worker(self):
         """Generate and send EMG data when triggered"""
         print("🎲 Data generator worker started")
         
         sample_interval = 1.0 / self.sampling_rate
-        next_sample_time = time.time()
+        block = self.block_samples
+        block_interval = block * sample_interval
+        next_block_time = time.monotonic()
         sample_count = 0
-        
+
         while self.running:
             try:
-                current_time = time.time()
-                
-                # Check if we should send data
-                if (self.streaming and self.trigger_active and 
-                    self.stream_conn and current_time >= next_sample_time):
-                    
-                    # Generate EMG data for all channels (pad to 16 for protocol compatibility)
-                    timestamp = self.time_offset + sample_count * sample_interval
-                    emg_samples = []
-                    
-                    # Generate data for active channels
-                    for channel_id in range(self.num_sensors):
-                        sample = self._generate_emg_sample(channel_id, timestamp)
-                        emg_samples.append(float(sample))
-                    
-                    # Pad remaining channels with realistic noise to maintain 16-channel protocol
-                    while len(emg_samples) < 16:
-                        # Add small noise for unused channels
-                        noise_sample = np.random.normal(0, 5e-6)
-                        emg_samples.append(float(noise_sample))
-                    
-                    # Pack as 16 little-endian floats (64 bytes total)
-                    try:
-                        packed_data = struct.pack('<16f', *emg_samples)
-                        self.stream_conn.send(packed_data)
-                        
-                        sample_count += 1
-                        next_sample_time += sample_interval
-                        
-                        # Debug output (less frequent) - show in microvolts for readability
-                        if sample_count % 4000 == 0:
-                            print(f"📊 Sent {sample_count} samples | " +
-                                  " | ".join([f"Ch{i}: {emg_samples[i]*1e6:+4.0f}µV" 
-                                            for i in range(min(4, self.num_sensors))]))
-                        
-                    except Exception as e:
-                        print(f"❌ Error sending data: {e}")
-                        # Connection probably lost
-                        break
-                
-                else:
-                    # Sleep briefly to avoid busy waiting
-                    time.sleep(0.0001)
-                
+                if not (self.streaming and self.trigger_active and self.stream_conn):
+                    # Idle: re-arm the deadline so blocks don't burst out
+                    # when triggering resumes
+                    time.sleep(0.01)
+                    next_block_time = time.monotonic()
+                    continue
+
+                # Sleep until the next block deadline; advancing the
+                # deadline by a fixed step keeps the stream drift-free
+                delay = next_block_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                # Synthesize one block of samples for all channels at once
+                idx = sample_count + np.arange(block)
+                t = self.time_offset + idx * sample_interval
+                block_data = self._generate_emg_block(t, idx)
+
+                # Pad remaining channels with realistic noise to maintain
+                # the 16-channel protocol frame layout
+                frames = self._tx
+                frames[:, :self.num_sensors] = block_data
+                frames[:, self.num_sensors:] = (
+                    self._rng.standard_normal((block, 16 - self.num_sensors)) * 5e-6)
+
+                # Send the block as consecutive 64-byte frames straight from
+                # the array's buffer; sendall retries short writes so
+                # frames can't be torn
+                try:
+                    self.stream_conn.sendall(frames.data)
+
+                    sample_count += block
+                    next_block_time += block_interval
+
+                    # Debug output (less frequent) - show in microvolts for readability
+                    if sample_count % 4096 == 0:
+                        last_frame = frames[-1]
+                        self._log_q.append(
+                            f"📊 Sent {sample_count} samples | " +
+                            " | ".join([f"Ch{i}: {last_frame[i]*1e6:+4.0f}µV"
+                                      for i in range(min(4, self.num_sensors))]))
+
+                except Exception as e:
+                    print(f"❌ Error sending data: {e}")
+                    # Connection probably lost
+                    break
+
             except Exception as e:
                 print(f"❌ Error in data generator: {e}")
                 break
@@ -432,9 +648,20 @@ class DelsysSimulator:
             except:
                 pass
             self.stream_server = None
+
+        if self.stream_unix_server:
+            try:
+                self.stream_unix_server.close()
+            except:
+                pass
+            try:
+                os.unlink(self.STREAM_SOCKET_PATH)
+            except OSError:
+                pass
+            self.stream_unix_server = None
         
         # Wait for threads to finish
-        for thread in [self.command_thread, self.stream_thread, self.data_thread]:
+        for thread in [self.server_thread, self.data_thread, self.log_thread]:
             if thread and thread.is_alive():
                 thread.join(timeout=2.0)
         
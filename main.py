@@ -1,8 +1,21 @@
 """Main application file for EMG data streaming and recording."""
 
 import os
+import json
 import numpy as np
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response
+
+try:
+    # Rust-backed JSON encoder, much faster than stdlib json for float-heavy payloads
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    # Optional columnar transport: clients that Accept Arrow IPC get the
+    # live block as a RecordBatch built zero-copy from the float32 rows
+    import pyarrow as pa
+except ImportError:
+    pa = None
 import threading
 import traceback
 import datetime
@@ -13,6 +26,39 @@ from state_manager import ApplicationState
 
 app = Flask(__name__)
 
+if orjson is not None:
+    from flask.json.provider import JSONProvider
+
+    class OrjsonProvider(JSONProvider):
+        """App-wide JSON provider backed by orjson.
+
+        Routes every jsonify through the Rust encoder and serializes
+        ndarrays natively, so endpoints don't need tolist() conversions.
+        """
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+    print("⚡ orjson JSON provider enabled")
+
+try:
+    # Optional transfer compression for HTML and JSON. The binary /live_data
+    # payload is deliberately excluded: flask-compress rewrites its ETag
+    # (e.g. '38' -> '"38:br"'), which breaks the revision-based 304
+    # handshake, and brotli only shaved ~12% off the float32 block anyway
+    from flask_compress import Compress
+    app.config['COMPRESS_MIN_SIZE'] = 1024
+    app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+    app.config['COMPRESS_MIMETYPES'] = ['text/html', 'application/json']
+    Compress(app)
+    print("🗜️ Response compression enabled (flask-compress)")
+except ImportError:
+    pass
+
 # Let user select save directory before starting
 try:
     SAVE_DIRECTORY = select_save_directory()
@@ -26,6 +72,32 @@ except Exception as e:
 app_state = ApplicationState()
 
 
+# Placeholder channel names for the error fallback, built once (with their
+# header JSON) instead of per failed request
+FALLBACK_LABELS = [f'Ch{i}' for i in range(NUM_SENSORS)]
+FALLBACK_LABELS_JSON = json.dumps(FALLBACK_LABELS)
+
+# Labels change rarely (YAML edits, sensor renames), so the X-Labels header
+# JSON is cached against the label list and only re-encoded on change
+_labels_header_cache = {'key': None, 'json': '[]'}
+
+
+def labels_header(labels):
+    """Return the JSON-encoded X-Labels header value, cached across polls."""
+    key = tuple(labels)
+    if key != _labels_header_cache['key']:
+        _labels_header_cache['key'] = key
+        _labels_header_cache['json'] = json.dumps(labels)
+    return _labels_header_cache['json']
+
+
+def json_response(payload):
+    """Encode a JSON response with orjson when available, else jsonify."""
+    if orjson is not None:
+        return Response(orjson.dumps(payload), mimetype='application/json')
+    return jsonify(payload)
+
+
 # Flask Routes
 @app.route('/')
 def index():
@@ -49,17 +121,17 @@ def toggle_streaming():
 
         if action == 'start':
             success, message = app_state.start_delsys_streaming()
-            return jsonify({'success': success, 'message': message, 'streaming': success})
+            return json_response({'success': success, 'message': message, 'streaming': success})
         elif action == 'stop':
             success, message = app_state.stop_delsys_streaming()
-            return jsonify({'success': success, 'message': message, 'streaming': not success})
+            return json_response({'success': success, 'message': message, 'streaming': not success})
         else:
-            return jsonify({'success': False, 'message': 'Invalid action. Use "start" or "stop".'})
+            return json_response({'success': False, 'message': 'Invalid action. Use "start" or "stop".'})
 
     except Exception as e:
         print(f"❌ Error in toggle_streaming route: {e}")
         traceback.print_exc()
-        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+        return json_response({'success': False, 'message': f'Error: {str(e)}'})
 
 
 # Modified to handle click-to-record toggle
@@ -69,47 +141,79 @@ def toggle_recording():
         if app_state.is_recording_flag:
             # Currently recording - stop it
             success, message = app_state.stop_delsys_recording()
-            return jsonify({'success': success, 'message': message, 'recording': False})
+            return json_response({'success': success, 'message': message, 'recording': False})
         else:
             # Not recording - start it
             success, message = app_state.start_recording_segment()
-            return jsonify({'success': success, 'message': message, 'recording': success})
+            return json_response({'success': success, 'message': message, 'recording': success})
     except Exception as e:
         print(f"❌ Error in toggle_recording route: {e}")
         traceback.print_exc()
-        return jsonify({'success': False, 'message': f'Error: {str(e)}', 'recording': False})
+        return json_response({'success': False, 'message': f'Error: {str(e)}', 'recording': False})
 
 
 @app.route('/live_data')
 def live_data():
+    """Serve the live buffer as a raw float32 block with a small header.
+
+    The body is a (NUM_SENSORS, n) row-major float32 array; the shape and
+    channel labels travel in the X-Shape / X-Labels headers. This avoids
+    JSON-encoding thousands of floats per poll on the Flask thread.
+    """
     try:
-        with app_state.live_data_lock:
-            data_chunks = []
-            labels = []
-            for i in range(NUM_SENSORS):
-                channel_chunks = []
-                for chunk_dict in app_state.live_data_buffers[i]:
-                    channel_chunks.extend(chunk_dict['samples'])
-                data_chunks.append(channel_chunks)
-                if app_state.live_data_buffers[i] and len(app_state.live_data_buffers[i]) > 0:
-                    labels.append(app_state.live_data_buffers[i][-1]['label'])
-                else:
-                    # Use muscle labels from the YAML config if available
-                    try:
-                        muscle_labels = load_muscle_labels()
-                        if i < len(muscle_labels):
-                            labels.append(muscle_labels[i])
-                        else:
-                            labels.append(f'Ch{i}')
-                    except:
-                        labels.append(f'Ch{i}')
-            print(f"📤 Sending live data with labels: {labels}")  # Debug line
-        return jsonify({'data': data_chunks, 'labels': labels})
+        # Short-circuit when nothing new arrived since the client's last poll
+        etag = str(app_state.live_revision)
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304)
+
+        channel_data, labels = app_state.get_live_snapshot()
+        # Use muscle labels from the (cached) YAML config for channels with no data yet
+        try:
+            muscle_labels = load_muscle_labels()
+        except Exception:
+            muscle_labels = []
+        for i in range(NUM_SENSORS):
+            if channel_data[i].size == 0 and i < len(muscle_labels):
+                labels[i] = muscle_labels[i]
+        # Channels advance in lockstep, so trimming to the common minimum
+        # length yields a uniform block and drops at most one chunk
+        # The snapshot is already mean-pooled by the worker; just frame it
+        n = min((ch.size for ch in channel_data), default=0)
+        # Content negotiation: Arrow IPC when the client asks for it and
+        # pyarrow is installed; otherwise the raw float32 block as before
+        if pa is not None and 'application/vnd.apache.arrow.stream' in request.headers.get('Accept', ''):
+            # ch[-0:] is the whole array, so an empty channel alongside
+            # filled ones would give unequal column lengths; trim
+            # explicitly so n == 0 yields a valid zero-row batch
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(ch[-n:] if n > 0 else ch[:0], type=pa.float32())
+                 for ch in channel_data],
+                names=labels)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, batch.schema) as writer:
+                writer.write_batch(batch)
+            return Response(sink.getvalue().to_pybytes(),
+                            mimetype='application/vnd.apache.arrow.stream',
+                            headers={'X-Stride': str(app_state.LIVE_DS_FACTOR),
+                                     'ETag': etag})
+        if n > 0:
+            # Stream one channel row per chunk: serialization overlaps the
+            # socket writes and avoids stacking all rows into a second block
+            body = (ch[-n:].tobytes() for ch in channel_data)
+        else:
+            body = b''
+        return Response(body, mimetype='application/octet-stream',
+                        headers={'X-Labels': labels_header(labels),
+                                 'X-Shape': f'{NUM_SENSORS},{n}',
+                                 'X-Stride': str(app_state.LIVE_DS_FACTOR),
+                                 'ETag': etag})
     except Exception as e:
         print(f"❌ Error fetching live data: {e}")
         traceback.print_exc()
         # Return empty data on error to prevent frontend breakage
-        return jsonify({'data': [[] for _ in range(NUM_SENSORS)], 'labels': [f'Ch{i}' for i in range(NUM_SENSORS)]})
+        return Response(b'', mimetype='application/octet-stream',
+                        headers={'X-Labels': FALLBACK_LABELS_JSON,
+                                 'X-Shape': f'{NUM_SENSORS},0'})
 
 
 @app.route('/status')
@@ -120,18 +224,18 @@ def status():
             'is_recording': app_state.is_recording_flag,
             'handler_exists': app_state.handler is not None,
             'handler_streaming': app_state.handler.streaming if app_state.handler else False,
-            'buffer_sizes': [len(buf) for buf in app_state.recording_data_buffer],
+            'buffer_sizes': app_state.get_buffer_sizes(),
             'save_directory': SAVE_DIRECTORY,
             'trial_counter': app_state.trial_counter,
             'session_start_time': app_state.recording_session_start_time.isoformat() if app_state.recording_session_start_time else None,
             'system_time': datetime.datetime.now().isoformat(),
-            'buffer_capacity': app_state.LIVE_BUFFER_CHUNKS,
+            'buffer_capacity': app_state.LIVE_BUFFER_SAMPLES,
             'sampling_rate': SAMPLING_RATE,
             'active_channels': NUM_SENSORS
         }
-        return jsonify(status_info)
+        return json_response(status_info)
     except Exception as e:
-        return jsonify({'error': str(e)})
+        return json_response({'error': str(e)})
 
 
 if __name__ == '__main__':
@@ -143,7 +247,16 @@ if __name__ == '__main__':
         print("💡 You will need to click 'Start Streaming' in the UI to begin.")
         print(f"📊 Using {NUM_SENSORS} channels")
 
-        app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+        try:
+            # Bounded-thread WSGI server: a fixed pool keeps GUI polling from
+            # spawning unbounded threads that thrash the GIL against the
+            # recording worker; single process preserves the app_state singleton
+            from waitress import serve
+            print("🧰 Serving with waitress (4 worker threads)")
+            serve(app, host='0.0.0.0', port=5000, threads=4)
+        except ImportError:
+            print("⚠️  waitress not installed; falling back to the Flask dev server")
+            app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False, threaded=True)
     except Exception as e:
         print(f"❌ Error starting Flask server: {e}")
         traceback.print_exc()
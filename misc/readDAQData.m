@@ -55,8 +55,15 @@ function returnStruct = readDAQData(filename, saveStruct, makeFigure)
     % Add sample rate to the structure
     returnStruct.Fs = Fs;    
     
-    % Read data from binary file
-    [ana_in_data, count] = fread(fid_read, [Num_ch_AI+1,inf], 'double');
+    % Read data from binary file. Recordings from the Python GUI are
+    % little-endian float32 and record dtype in their metadata; older
+    % recordings were float64 and have no dtype field.
+    if isfield(meta_data, 'dtype') && strcmp(meta_data.dtype, 'float32')
+        precision = 'single';
+    else
+        precision = 'double';
+    end
+    [ana_in_data, count] = fread(fid_read, [Num_ch_AI+1,inf], precision);
     
     muscle_labels = meta_data.musc_labels;
     extra_lab = length(EMG_CH)-length(muscle_labels);
@@ -88,6 +95,12 @@ function returnStruct = readDAQData(filename, saveStruct, makeFigure)
         'ARDUINO_ACTIVE', 'DS8R_SYNC'};
 
     returnStruct.time = ana_in_data(1, :);
+    if strcmp(precision, 'single')
+        % float32 quantizes the stored timestamps (~30 us near the 600 s
+        % recording cap); the recorder writes a uniform 0-based ramp, so
+        % rebuild it at double precision from the sampling rate instead
+        returnStruct.time = (0:size(ana_in_data, 2) - 1) / Fs;
+    end
     % Append the DAQ data
     for i = 1:length(DAQ_labels)
         returnStruct.(DAQ_labels{i}) = ana_in_data(i+1, :);
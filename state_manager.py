@@ -1,12 +1,17 @@
 """State management for the EMG application."""
 
 import threading
-import collections
+import tempfile
 import time
 import queue
 import datetime
-from config import NUM_SENSORS, SAMPLING_RATE
+import logging
+import numpy as np
+from config import NUM_SENSORS, SAMPLING_RATE, MAX_RECORD_SECONDS, LIVE_DOWNSAMPLE
 from delsys import DelsysDataHandler
+from utils import boost_thread_priority
+
+logger = logging.getLogger(__name__)
 
 
 class ApplicationState:
@@ -15,20 +20,184 @@ class ApplicationState:
     def __init__(self):
         # Global State
         self.handler = None
-        self.recording_data_buffer = [[] for _ in range(NUM_SENSORS + 1)]
+        # Preallocated recording buffer: one float32 row per channel plus a
+        # per-channel write index. Chunks are written with slice assignment
+        # instead of growing Python lists one boxed float at a time.
+        # The buffer is backed by an unlinked scratch-file memmap, so samples
+        # spill to disk as the kernel writes pages back: worker code is plain
+        # slice assignment either way, but max-length trials cost O(working
+        # set) RSS instead of pinning the whole segment in RAM.
+        self.MAX_RECORD_SAMPLES = int(MAX_RECORD_SECONDS * SAMPLING_RATE)
+        self._recording_scratch = tempfile.TemporaryFile(prefix='emg_recording_')
+        self.recording_array = np.memmap(self._recording_scratch, dtype=np.float32,
+                                         mode='w+', shape=(NUM_SENSORS, self.MAX_RECORD_SAMPLES))
+        self.recording_lengths = np.zeros(NUM_SENSORS, dtype=np.int64)
         self.recording_lock = threading.Lock()
-        self.is_recording_flag = False
+        # Atomic recording flag: the worker reads it lock-free on every chunk;
+        # recording_lock is only taken at segment start/stop boundaries.
+        self.recording_event = threading.Event()
+        # Set by the worker once it has drained its queue after the recording
+        # flag was cleared; stop_delsys_recording waits on it instead of a
+        # fixed sleep before saving the buffers
+        self.recording_drained = threading.Event()
         self.start_time = None
+        # Number of chunks still to log at DEBUG level per recording segment
+        self._dbg_remaining = 0
 
         # Recording Session Info
         self.recording_session_start_time = None
         self.trial_counter = 1
 
         # Live Data Buffering for GUI
-        self.LIVE_BUFFER_CHUNKS = 6000
-        self.live_data_buffers = [collections.deque(maxlen=self.LIVE_BUFFER_CHUNKS) for _ in range(NUM_SENSORS)]
-        self.live_data_lock = threading.Lock()
-        
+        # Fixed-size NumPy ring buffer per channel: O(1) writes from the worker
+        # and O(k) contiguous reads for /live_data (no per-chunk dicts/lists).
+        # Only the downsampled display ring is kept; full-rate samples go to
+        # the recording buffer, so buffering them again here would be dead
+        # work on the 2 kHz path.
+        self.LIVE_BUFFER_SAMPLES = 6000  # ~3 s of data at 2 kHz
+        self.live_labels = [f'Ch{i}' for i in range(NUM_SENSORS)]
+        # Lock-free publish: readers of the live rings don't take a mutex —
+        # a seqlock suffices. Writers bump _live_seq to an odd value before
+        # touching the rings and back to even afterwards; readers snapshot,
+        # then retry if the sequence was odd or changed underneath them.
+        # _live_write_lock serializes the writers among themselves (the
+        # worker's batch publishes and buffer clears from request threads),
+        # keeping the counter single-writer at any instant; readers only
+        # fall back to it after a few failed lock-free attempts.
+        self._live_seq = 0
+        self._live_write_lock = threading.Lock()
+        # Bumped once per consumed batch; /live_data uses it as an ETag so
+        # idle polls can return 304 without touching the buffers
+        self.live_revision = 0
+        # Downsampled copy maintained by the worker via streaming mean-pooling;
+        # /live_data serves this ring directly so the endpoint does no
+        # per-request reduction work
+        self.LIVE_DS_FACTOR = LIVE_DOWNSAMPLE
+        self.live_ds_ring = np.zeros(
+            (NUM_SENSORS, self.LIVE_BUFFER_SAMPLES // self.LIVE_DS_FACTOR), dtype=np.float32)
+        self.live_ds_write_idx = np.zeros(NUM_SENSORS, dtype=np.int64)
+        self._ds_carry = np.zeros((NUM_SENSORS, self.LIVE_DS_FACTOR), dtype=np.float32)
+        self._ds_carry_len = np.zeros(NUM_SENSORS, dtype=np.int64)
+
+    def _ring_write(self, ring, write_idx, channel_id, samples):
+        """Write samples into one channel row of a ring buffer.
+
+        Producer-only: must run inside a _live_seq odd/even window. Handles
+        wrap-around with at most two slice assignments.
+        """
+        cap = ring.shape[1]
+        n = len(samples)
+        if n >= cap:
+            # Chunk larger than the ring: keep only the newest samples.
+            # They land at offset 0, so round the advanced index up to a
+            # multiple of cap — the snapshot unwrap rotates by total % cap
+            # and the oldest kept sample must sit at that origin
+            ring[channel_id, :] = samples[-cap:]
+            write_idx[channel_id] = ((write_idx[channel_id] + n) // cap) * cap
+            return
+        w = int(write_idx[channel_id] % cap)
+        end = w + n
+        if end <= cap:
+            ring[channel_id, w:end] = samples
+        else:
+            k = cap - w
+            ring[channel_id, w:] = samples[:k]
+            ring[channel_id, :n - k] = samples[k:]
+        write_idx[channel_id] += n
+
+    def _live_ring_write(self, channel_id, samples):
+        """Write a chunk into the downsampled display ring.
+
+        Producer-only: must run inside a _live_seq odd/even window. The
+        ring gets one mean value per LIVE_DS_FACTOR samples; leftovers that
+        don't fill a whole pooling window carry over to the next chunk.
+        """
+        f = self.LIVE_DS_FACTOR
+        carry_len = int(self._ds_carry_len[channel_id])
+        if carry_len == 0 and len(samples) % f == 0:
+            # Steady-state fast path specialized to the fixed batch shape:
+            # EMG_BATCH_FRAMES is a multiple of the pooling factor, so every
+            # batch pools exactly — no concatenate, no carry bookkeeping
+            pooled = samples.reshape(-1, f).mean(axis=1, dtype=np.float32)
+            self._ring_write(self.live_ds_ring, self.live_ds_write_idx, channel_id, pooled)
+            return
+        if carry_len:
+            samples = np.concatenate((self._ds_carry[channel_id, :carry_len], samples))
+        n = (len(samples) // f) * f
+        if n:
+            pooled = samples[:n].reshape(-1, f).mean(axis=1, dtype=np.float32)
+            self._ring_write(self.live_ds_ring, self.live_ds_write_idx, channel_id, pooled)
+        rem = len(samples) - n
+        if rem:
+            self._ds_carry[channel_id, :rem] = samples[n:]
+        self._ds_carry_len[channel_id] = rem
+
+    def _clear_live_buffers(self):
+        """Reset the live ring buffers (seqlock write side)."""
+        with self._live_write_lock:
+            self._live_seq += 1
+            try:
+                self.live_ds_write_idx[:] = 0
+                self._ds_carry_len[:] = 0
+            finally:
+                self._live_seq += 1
+
+    def _copy_live_snapshot(self):
+        """Copy the downsampled rings into fresh time-ordered arrays."""
+        ring = self.live_ds_ring
+        write_idx = self.live_ds_write_idx
+        cap = ring.shape[1]
+        data = []
+        labels = []
+        for ch in range(NUM_SENSORS):
+            total = int(write_idx[ch])
+            if total >= cap:
+                # Un-wrap straight into the output array: two slice
+                # copies, no intermediate halves from np.concatenate
+                w = total % cap
+                out = np.empty(cap, dtype=np.float32)
+                out[:cap - w] = ring[ch, w:]
+                out[cap - w:] = ring[ch, :w]
+                data.append(out)
+            else:
+                data.append(ring[ch, :total].copy())
+            labels.append(self.live_labels[ch])
+        return data, labels
+
+    def get_live_snapshot(self):
+        """Return (per-channel downsampled arrays in time order, labels) for the GUI.
+
+        Lock-free seqlock read: copy the rings, then verify the writers'
+        sequence counter didn't move. A torn snapshot (seq odd or changed)
+        is retried a few times — at 16 ms per batch the second attempt
+        virtually always lands in a quiet window — then falls back to one
+        read under the writer lock so request threads can never spin
+        unbounded.
+        """
+        for _ in range(8):
+            seq = self._live_seq
+            if seq & 1:
+                time.sleep(0)  # writer mid-publish; yield and retry
+                continue
+            data, labels = self._copy_live_snapshot()
+            if self._live_seq == seq:
+                return data, labels
+        with self._live_write_lock:
+            return self._copy_live_snapshot()
+
+    def get_buffer_sizes(self):
+        """Per-channel recorded sample counts as a plain list for /status.
+
+        One contiguous read of the write-index array; no per-channel
+        Python-object traffic against the recording worker.
+        """
+        return self.recording_lengths.tolist()
+
+    @property
+    def is_recording_flag(self):
+        """Whether a recording segment is currently active."""
+        return self.recording_event.is_set()
+
     def recording_worker(self):
         """Worker thread to read data from the handler's queue continuously."""
         local_sample_count = 0
@@ -36,40 +205,78 @@ class ApplicationState:
         try:
             while self.handler and self.handler.streaming:
                 try:
-                    processed_data = self.handler.output_queue.get(timeout=1.0)
-                    channel_id = processed_data['channel']
-                    samples = processed_data['samples']
-                    muscle_label = processed_data.get('muscle_label', f'Ch{channel_id}')
-
-                    # Only process data for the first NUM_SENSORS channels
-                    if channel_id >= NUM_SENSORS:
-                        continue
-
-                    # Always update live data buffers for visualization
-                    with self.live_data_lock:
-                        self.live_data_buffers[channel_id].append({
-                            'samples': samples.tolist(),
-                            'label': muscle_label
-                        })
-
-                    # Conditionally record data based on is_recording_flag
-                    with self.recording_lock:
-                        if self.is_recording_flag:
-                            self.recording_data_buffer[channel_id + 1].extend(samples)
-                            local_sample_count += len(samples)
+                    # Block for the first packet, then drain everything else
+                    # already queued so a backlog is absorbed in one pass
+                    # (one wakeup + one seqlock window, not one per packet)
+                    packets = [self.handler.output_queue.get(timeout=1.0)]
+                    try:
+                        while True:
+                            packets.append(self.handler.output_queue.get_nowait())
+                    except queue.Empty:
+                        pass
+                    # The ring's drop-oldest overflow race can surface a
+                    # consumed (None) slot; skip those rather than crash
+                    packets = [p for p in packets if p is not None]
+
+                    # Always update live data buffers for visualization.
+                    # Seqlock publish: odd while writing, even when stable,
+                    # so /live_data readers never block this thread. The
+                    # finally keeps the counter even if a packet is
+                    # malformed, so readers can't spin on a dead odd window.
+                    with self._live_write_lock:
+                        self._live_seq += 1
+                        try:
+                            for packet in packets:
+                                batch = packet.samples  # (channels, n) array
+                                labels = packet.labels or []
+                                # Only process data for the first NUM_SENSORS channels
+                                num_channels = min(len(batch), NUM_SENSORS)
+                                for channel_id in range(num_channels):
+                                    self._live_ring_write(channel_id, batch[channel_id])
+                                    if channel_id < len(labels):
+                                        self.live_labels[channel_id] = labels[channel_id]
+                        finally:
+                            self._live_seq += 1
+                    self.live_revision += 1
+
+                    # Conditionally record data based on the atomic recording flag
+                    # (no lock on the per-batch path; buffers are only swapped
+                    # at start/stop boundaries while the flag is cleared)
+                    if self.recording_event.is_set():
+                        for packet in packets:
+                            batch = packet.samples
+                            num_channels = min(len(batch), NUM_SENSORS)
+                            for channel_id in range(num_channels):
+                                samples = batch[channel_id]
+                                idx = int(self.recording_lengths[channel_id])
+                                end = min(idx + len(samples), self.MAX_RECORD_SAMPLES)
+                                if idx < end:
+                                    self.recording_array[channel_id, idx:end] = samples[:end - idx]
+                                    self.recording_lengths[channel_id] = end
+                            n = batch.shape[1] if hasattr(batch, 'shape') else len(batch[0])
                             # Set start_time for the recording segment only
-                            if self.start_time is None and local_sample_count == len(samples):
+                            if self.start_time is None and local_sample_count == 0:
                                 self.start_time = time.time()
                                 print(f"📍 Recording segment start time set: {self.start_time}")
-
-                    # Debug: Print first few samples with more context
-                    if local_sample_count < 100 and self.is_recording_flag:
-                        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-                        print(f"[{timestamp}] 📏 Recording Ch{channel_id+1}/{NUM_SENSORS}: {samples[0]:.6f} V ({muscle_label}) | Sample count: {local_sample_count}")
-                    elif local_sample_count == 100 and self.is_recording_flag:
-                        print(f"Suppressing further recording debug prints for this segment (Ch{channel_id})...")
+                            local_sample_count += n
+
+                            # Debug: log the first few recorded batches only, and
+                            # keep stdout/strftime work off the hot path entirely
+                            if self._dbg_remaining:
+                                self._dbg_remaining -= 1
+                                if logger.isEnabledFor(logging.DEBUG):
+                                    logger.debug("Recording batch of %d samples x %d channels | Sample count: %d",
+                                                 n, num_channels, local_sample_count)
+
+                    # Every queued packet up to here is now in the buffers;
+                    # if the recording flag is down, the segment is drained
+                    # and the stopping thread may safely save
+                    if not self.recording_event.is_set():
+                        self.recording_drained.set()
 
                 except queue.Empty:
+                    if not self.recording_event.is_set():
+                        self.recording_drained.set()
                     continue
                 except Exception as e:
                     print(f"❌ Error in recording worker loop: {e}")
@@ -84,12 +291,9 @@ class ApplicationState:
         try:
             # Clear buffers at the very beginning of a new streaming session
             with self.recording_lock:
-                for i in range(len(self.recording_data_buffer)):
-                    self.recording_data_buffer[i].clear()
+                self.recording_lengths[:] = 0
             self.start_time = None
-            with self.live_data_lock:
-                for buffer in self.live_data_buffers:
-                    buffer.clear()
+            self._clear_live_buffers()
 
             # Stop existing handler if running
             if self.handler is not None:
@@ -101,7 +305,7 @@ class ApplicationState:
                 self.handler = None
 
             # Reset recording state
-            self.is_recording_flag = False
+            self.recording_event.clear()
 
             # Initialize session time and trial counter for new session
             self.recording_session_start_time = datetime.datetime.now()
@@ -117,6 +321,8 @@ class ApplicationState:
                 # Start the worker thread *after* successful streaming start
                 worker_thread = threading.Thread(target=self.recording_worker, daemon=True)
                 worker_thread.start()
+                # Keep the 2 kHz worker ahead of request threads in the scheduler
+                boost_thread_priority(worker_thread)
                 return True, "Streaming started successfully."
             else:
                 # Failed to start streaming
@@ -159,14 +365,12 @@ class ApplicationState:
                         self.handler = None
 
                 # Reset states regardless
-                self.is_recording_flag = False
+                self.recording_event.clear()
                 # Clear buffers
-                self.recording_data_buffer = [[] for _ in range(NUM_SENSORS + 1)]
+                self.recording_lengths[:] = 0
                 self.start_time = None
                 # Clear live buffers
-                with self.live_data_lock:
-                    for buffer in self.live_data_buffers:
-                        buffer.clear()
+                self._clear_live_buffers()
 
             return True, "Streaming stopped successfully."
 
@@ -179,13 +383,11 @@ class ApplicationState:
                 except Exception as cleanup_e:
                     print(f"Error during cleanup stop: {cleanup_e}")
                 self.handler = None
-            self.is_recording_flag = False
+            self.recording_event.clear()
             with self.recording_lock:
-                self.recording_data_buffer = [[] for _ in range(NUM_SENSORS + 1)]
+                self.recording_lengths[:] = 0
                 self.start_time = None
-            with self.live_data_lock:
-                for buffer in self.live_data_buffers:
-                    buffer.clear()
+            self._clear_live_buffers()
             return False, f"Error stopping streaming: {str(e)}"
 
     def start_recording_segment(self):
@@ -198,11 +400,11 @@ class ApplicationState:
                     return False, "Streaming is not active. Start streaming first."
 
                 # Clear buffers for the new recording segment
-                for i in range(len(self.recording_data_buffer)):
-                    self.recording_data_buffer[i].clear()
+                self.recording_lengths[:] = 0
                 self.start_time = None
 
-                self.is_recording_flag = True
+                self._dbg_remaining = 100
+                self.recording_event.set()
                 print(f"⏺️ Recording segment started (Trial #{self.trial_counter}).")
                 return True, f"Recording segment started (Trial #{self.trial_counter})."
         except Exception as e:
@@ -216,12 +418,16 @@ class ApplicationState:
         
         try:
             with self.recording_lock:
-                if not self.is_recording_flag:
+                if not self.recording_event.is_set():
                     return False, "No recording segment in progress."
-                self.is_recording_flag = False
-                print("🛑 Recording flag set to False for current segment.")
+                self.recording_drained.clear()
+                self.recording_event.clear()
+                print("🛑 Recording flag cleared for current segment.")
 
-            time.sleep(0.1)
+            # Wait until the worker has flushed everything queued before the
+            # flag went down (typically <20 ms, vs. the old fixed 100 ms
+            # sleep); the timeout only guards against a stalled worker
+            self.recording_drained.wait(timeout=0.5)
 
             # Load muscle labels from YAML configuration file
             muscle_labels = load_muscle_labels()
@@ -229,7 +435,8 @@ class ApplicationState:
             # Save data for the completed segment
             success, message, min_samples = save_emg_recording(
                 save_directory='./recordings',
-                recording_data_buffer=self.recording_data_buffer,
+                recording_array=self.recording_array,
+                recording_lengths=self.recording_lengths,
                 start_time=self.start_time,
                 sampling_rate=SAMPLING_RATE,
                 muscle_labels=muscle_labels,
@@ -239,7 +446,7 @@ class ApplicationState:
 
             # Clear buffers for next segment
             with self.recording_lock:
-                self.recording_data_buffer = [[] for _ in range(NUM_SENSORS + 1)]
+                self.recording_lengths[:] = 0
                 self.start_time = None
 
             if success:
@@ -253,6 +460,6 @@ class ApplicationState:
         except Exception as e:
             print(f"❌ Error stopping recording segment: {e}")
             with self.recording_lock:
-                self.recording_data_buffer = [[] for _ in range(NUM_SENSORS + 1)]
+                self.recording_lengths[:] = 0
                 self.start_time = None
             return False, f"Error stopping recording: {str(e)}"
\ No newline at end of file
@@ -1,10 +1,22 @@
 """Utility functions for the EMG application."""
 
 import os
+import sys
 import tkinter as tk
 from tkinter import filedialog
 import yaml
 
+try:
+    # C-backed loader (libyaml), typically 5-10x faster than the pure-Python one
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+DEFAULT_MUSCLE_LABELS = ['L-TIBI', 'L-GAST', 'L-RECT', 'R-TIBI']
+
+# Cache for load_muscle_labels, invalidated when the file's mtime changes
+_labels_cache = {'mtime': None, 'labels': None}
+
 
 def select_save_directory():
     """Open a dialog to select the save directory before starting the app."""
@@ -23,19 +35,53 @@ def select_save_directory():
     return save_dir
 
 
+def boost_thread_priority(thread):
+    """Best-effort raise of a worker thread's OS scheduling priority.
+
+    Keeps the acquisition worker from being starved by request threads under
+    load. Silently does nothing when the platform or permissions (e.g. no
+    CAP_SYS_NICE on Linux) don't allow it.
+    """
+    try:
+        native_id = thread.native_id
+        if native_id is None:
+            return
+        if sys.platform == 'win32':
+            import ctypes
+            THREAD_SET_INFORMATION = 0x0020
+            THREAD_PRIORITY_ABOVE_NORMAL = 1
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenThread(THREAD_SET_INFORMATION, False, native_id)
+            if handle:
+                kernel32.SetThreadPriority(handle, THREAD_PRIORITY_ABOVE_NORMAL)
+                kernel32.CloseHandle(handle)
+        elif hasattr(os, 'sched_setscheduler'):
+            os.sched_setscheduler(native_id, os.SCHED_FIFO, os.sched_param(10))
+    except (OSError, AttributeError):
+        pass
+
+
 def load_muscle_labels(config_file="muscle_labels.yaml"):
-    """Load muscle labels from YAML configuration file."""
+    """Load muscle labels from YAML configuration file.
+
+    The parsed labels are cached and only re-read when the file's mtime
+    changes, so repeated calls cost one stat() instead of a YAML parse.
+    """
     try:
         yaml_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), config_file)
-        print(f"🔍 Looking for muscle labels file at: {yaml_path}")
+        mtime = os.stat(yaml_path).st_mtime
+        if mtime == _labels_cache['mtime']:
+            return _labels_cache['labels']
         with open(yaml_path, 'r') as f:
-            config = yaml.safe_load(f)
-            muscle_labels = config.get('muscle_labels', ['L-TIBI', 'L-GAST', 'L-RECT', 'R-TIBI'])
+            config = yaml.load(f, Loader=_YamlLoader)
+            muscle_labels = config.get('muscle_labels', DEFAULT_MUSCLE_LABELS)
+            _labels_cache['mtime'] = mtime
+            _labels_cache['labels'] = muscle_labels
             print(f"✅ Loaded muscle labels: {muscle_labels}")
             return muscle_labels
     except FileNotFoundError:
         print("⚠️  muscle_labels.yaml not found. Using default labels.")
-        return ['L-TIBI', 'L-GAST', 'L-RECT', 'R-TIBI']
+        return DEFAULT_MUSCLE_LABELS
     except Exception as e:
         print(f"❌ Error loading muscle labels: {e}. Using default labels.")
-        return ['L-TIBI', 'L-GAST', 'L-RECT', 'R-TIBI']
\ No newline at end of file
+        return DEFAULT_MUSCLE_LABELS